@@ -15,15 +15,34 @@ Requirements:
     (``ollama pull nomic-embed-text``)
 """
 
+import asyncio
+import atexit
+import hashlib
+import json
+import sqlite3
+import string
+import textwrap
 import time
 import uuid
 from datetime import datetime, timezone
 
 import httpx
+import numpy as np
 from qdrant_client import QdrantClient
 from qdrant_client.models import (
     Distance,
+    FieldCondition,
+    Filter,
+    HnswConfigDiff,
+    MatchValue,
+    PayloadSchemaType,
     PointStruct,
+    QuantizationSearchParams,
+    QueryRequest,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    SearchParams,
     VectorParams,
 )
 
@@ -31,10 +50,131 @@ from qdrant_client.models import (
 # Config defaults (overridable via init)
 # ---------------------------------------------------------------------------
 DEFAULT_QDRANT_URL = "http://localhost:6333"
+DEFAULT_QDRANT_GRPC_PORT = 6334
+# gRPC channel pool; the client default of 3 bottlenecks the
+# upsert+recall mix once several parts share one connection.
+QDRANT_POOL_SIZE = 32
 DEFAULT_OLLAMA_URL = "http://localhost:11434"
 EMBEDDING_MODEL = "nomic-embed-text"
 EMBEDDING_DIM = 768  # nomic-embed-text outputs 768-d vectors
 
+# Shared HTTP client so every embedding call reuses the same keep-alive
+# connection pool instead of paying a fresh DNS/TCP handshake per request.
+_HTTP = httpx.Client(
+    http2=True,
+    limits=httpx.Limits(
+        max_keepalive_connections=40,
+        max_connections=100,
+        keepalive_expiry=30.0,
+    ),
+    timeout=httpx.Timeout(60.0, connect=10.0),
+)
+atexit.register(_HTTP.close)
+
+# Async twin of _HTTP for callers running inside an event loop.
+_AHTTP = httpx.AsyncClient(
+    http2=True,
+    limits=httpx.Limits(
+        max_keepalive_connections=40,
+        max_connections=100,
+        keepalive_expiry=30.0,
+    ),
+    timeout=httpx.Timeout(60.0, connect=10.0),
+)
+
+
+async def aclose_async_client() -> None:
+    """Close the shared async HTTP client.
+
+    Must be awaited from the event loop that used it (e.g. a ``finally``
+    in the app's main coroutine): closing its transports from a fresh
+    loop at interpreter exit raises "Event loop is closed".
+    """
+    if not _AHTTP.is_closed:
+        await _AHTTP.aclose()
+
+# Cap on concurrent embedding requests so bursts don't overwhelm Ollama.
+MAX_EMBED_CONCURRENCY = 10
+
+# Buffered points are written to Qdrant once this many accumulate (or on
+# the next read / explicit flush), amortising the per-upsert roundtrip.
+FLUSH_EVERY = 8
+
+# How long a recall() result stays valid when the same query repeats.
+RECALL_TTL_S = 60.0
+
+# Bounds for build_context_summary: Claude's cost is linear in prompt
+# length, so only the most recent events make it into the prompt.
+SUMMARY_MAX_EVENTS = 20
+SUMMARY_LINE_WIDTH = 160
+
+# On-disk embedding cache shared by all parts in this process.
+DEFAULT_CACHE_PATH = ".solidvoice_embeddings.db"
+
+
+class _EmbeddingCache:
+    """Content-addressed cache of text -> embedding vector.
+
+    Keys are BLAKE2b-16 digests of (model, text) so the same phrase never
+    hits Ollama twice, even across sessions.  Vectors are stored as
+    float32 bytes (half the size of a float64 list) in a small SQLite
+    file, fronted by an in-process dict for repeat lookups.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH):
+        self._mem: dict[bytes, list[float]] = {}
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS emb (key BLOB PRIMARY KEY, vec BLOB)"
+        )
+        self._db.commit()
+
+    @staticmethod
+    def _key(text: str) -> bytes:
+        return hashlib.blake2b(
+            f"{EMBEDDING_MODEL}\x00{text}".encode(), digest_size=16
+        ).digest()
+
+    def get(self, text: str) -> list[float] | None:
+        key = self._key(text)
+        vec = self._mem.get(key)
+        if vec is not None:
+            return vec
+        row = self._db.execute(
+            "SELECT vec FROM emb WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        vec = np.frombuffer(row[0], dtype=np.float32).tolist()
+        self._mem[key] = vec
+        return vec
+
+    def put(self, text: str, vec: list[float]) -> None:
+        key = self._key(text)
+        self._mem[key] = vec
+        blob = np.asarray(vec, dtype=np.float32).tobytes()
+        self._db.execute(
+            "INSERT OR REPLACE INTO emb (key, vec) VALUES (?, ?)", (key, blob)
+        )
+        self._db.commit()
+
+    def close(self) -> None:
+        self._db.close()
+
+
+_CACHE = _EmbeddingCache()
+atexit.register(_CACHE.close)
+
+# Collections already verified to exist this session, so repeated
+# PartMemory construction for the same part skips the server check.
+_KNOWN_COLLECTIONS: set[str] = set()
+
+# Search against the int8-quantized vectors, then rescore the shortlist
+# with the original floats so recall quality is unchanged.
+_SEARCH_PARAMS = SearchParams(
+    quantization=QuantizationSearchParams(rescore=True, oversampling=2.0)
+)
+
 
 class PartMemory:
     """Vector-backed memory store for a single SolidWorks part."""
@@ -44,12 +184,30 @@ class PartMemory:
         part_name: str,
         qdrant_url: str = DEFAULT_QDRANT_URL,
         ollama_url: str = DEFAULT_OLLAMA_URL,
+        http_client: httpx.Client | None = None,
+        async_http_client: httpx.AsyncClient | None = None,
+        qdrant_client: QdrantClient | None = None,
     ):
         self.part_name = part_name
         # Sanitise the collection name (Qdrant allows alphanumeric + _ -)
         self.collection = _safe_collection_name(part_name)
-        self.qdrant = QdrantClient(url=qdrant_url)
+        # Prefer gRPC: binary protobuf framing over a persistent HTTP/2
+        # channel costs fewer bytes and less latency per point than REST.
+        self.qdrant = qdrant_client or QdrantClient(
+            url=qdrant_url,
+            prefer_grpc=True,
+            grpc_port=DEFAULT_QDRANT_GRPC_PORT,
+            pool_size=QDRANT_POOL_SIZE,
+            timeout=60,
+        )
         self.ollama_url = ollama_url.rstrip("/")
+        self._client = http_client or _HTTP
+        self._aclient = async_http_client or _AHTTP
+        self._pending: list[PointStruct] = []
+        # Local mirrors of server state so every voice command doesn't
+        # re-scroll Qdrant / re-embed the same query.
+        self._history_cache: list[dict] | None = None
+        self._recall_cache: dict[tuple, tuple[float, list[dict]]] = {}
         self._ensure_collection()
 
     # ------------------------------------------------------------------
@@ -57,28 +215,106 @@ class PartMemory:
     # ------------------------------------------------------------------
     def _ensure_collection(self):
         """Create the Qdrant collection for this part if it doesn't exist."""
-        existing = [c.name for c in self.qdrant.get_collections().collections]
-        if self.collection not in existing:
+        if self.collection in _KNOWN_COLLECTIONS:
+            return
+        if not self.qdrant.collection_exists(self.collection):
             self.qdrant.create_collection(
                 collection_name=self.collection,
                 vectors_config=VectorParams(
                     size=EMBEDDING_DIM, distance=Distance.COSINE
                 ),
+                # Keep int8-quantized vectors in RAM (4x smaller than
+                # float32) and spill the HNSW graph to disk.
+                quantization_config=ScalarQuantization(
+                    scalar=ScalarQuantizationConfig(
+                        type=ScalarType.INT8, always_ram=True
+                    )
+                ),
+                hnsw_config=HnswConfigDiff(on_disk=True),
             )
+        # Index ts_ns for cheap time-ordered access (integer compares
+        # beat ISO-string compares) and feature_type so filtered recall
+        # ("only extrudes") walks an inverted index instead of scanning
+        # every payload.  These calls are idempotent and run for
+        # pre-existing collections too, since part names recur across
+        # sessions and collections persisted by older versions of this
+        # module lack the indexes.
+        self.qdrant.create_payload_index(
+            collection_name=self.collection,
+            field_name="ts_ns",
+            field_schema=PayloadSchemaType.INTEGER,
+        )
+        self.qdrant.create_payload_index(
+            collection_name=self.collection,
+            field_name="feature_type",
+            field_schema=PayloadSchemaType.KEYWORD,
+        )
+        _KNOWN_COLLECTIONS.add(self.collection)
 
     # ------------------------------------------------------------------
     # Embedding via Ollama (local nomic-embed-text)
     # ------------------------------------------------------------------
-    def _embed(self, text: str) -> list[float]:
-        """Get an embedding vector from Ollama's nomic-embed-text model."""
-        resp = httpx.post(
-            f"{self.ollama_url}/api/embed",
-            json={"model": EMBEDDING_MODEL, "input": text},
-            timeout=30.0,
-        )
-        resp.raise_for_status()
-        data = resp.json()
-        return data["embeddings"][0]
+    def _embed(self, texts: list[str]) -> list[list[float]]:
+        """Get embedding vectors for a batch of texts in one Ollama request.
+
+        Ollama's ``/api/embed`` endpoint accepts a list of inputs and
+        returns one embedding per item, so embedding N texts costs a
+        single HTTP roundtrip instead of N.  Cached texts are served
+        locally and only the misses go over the wire.
+        """
+        vectors = [_CACHE.get(t) for t in texts]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            resp = self._client.post(
+                f"{self.ollama_url}/api/embed",
+                json={
+                    "model": EMBEDDING_MODEL,
+                    "input": [texts[i] for i in missing],
+                },
+            )
+            resp.raise_for_status()
+            for i, vec in zip(missing, resp.json()["embeddings"]):
+                vectors[i] = vec
+                _CACHE.put(texts[i], vec)
+        return vectors
+
+    def _embed_one(self, text: str) -> list[float]:
+        """Embed a single text (thin wrapper over the batch endpoint)."""
+        return self._embed([text])[0]
+
+    async def aembed(self, texts: list[str]) -> list[list[float]]:
+        """Async version of :meth:`_embed` (one request, many inputs)."""
+        vectors = [_CACHE.get(t) for t in texts]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            resp = await self._aclient.post(
+                f"{self.ollama_url}/api/embed",
+                json={
+                    "model": EMBEDDING_MODEL,
+                    "input": [texts[i] for i in missing],
+                },
+            )
+            resp.raise_for_status()
+            for i, vec in zip(missing, resp.json()["embeddings"]):
+                vectors[i] = vec
+                _CACHE.put(texts[i], vec)
+        return vectors
+
+    async def aembed_batch(
+        self, batches: list[list[str]]
+    ) -> list[list[list[float]]]:
+        """Embed several batches concurrently, bounded by a semaphore.
+
+        Useful when many independent groups of texts become ready at once:
+        the HTTP latencies overlap instead of accumulating serially.
+        """
+        sem = asyncio.Semaphore(MAX_EMBED_CONCURRENCY)
+
+        async def _one(batch: list[str]) -> list[list[float]]:
+            async with sem:
+                return await self.aembed(batch)
+
+        return await asyncio.gather(*(_one(b) for b in batches))
 
     # ------------------------------------------------------------------
     # Store a feature event
@@ -103,94 +339,354 @@ class PartMemory:
         Returns:
             The UUID of the stored point.
         """
-        description = (
-            f"{feature_type}: {label}. "
-            f"Intent: {user_intent}. "
-            f"Params: {parameters}"
-        )
-        vector = self._embed(description)
-
-        point_id = str(uuid.uuid4())
-        payload = {
+        return self.record_features([{
             "feature_type": feature_type,
             "label": label,
             "user_intent": user_intent,
             "parameters": parameters,
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "description": description,
-        }
-        if extra:
-            payload.update(extra)
+            "extra": extra,
+        }])[0]
+
+    def record_features(self, events: list[dict]) -> list[str]:
+        """Record several feature operations in one embed + upsert roundtrip.
+
+        Each event is a dict with the same keys as :meth:`record_feature`
+        arguments.  All descriptions are embedded in a single Ollama batch
+        call and stored with a single Qdrant upsert.
+
+        Returns:
+            The UUIDs of the stored points, in event order.
+        """
+        descriptions = [_describe(ev) for ev in events]
+        vectors = self._embed(descriptions)
+        points = _build_points(events, descriptions, vectors)
+        self._pending.extend(points)
+        self._note_recorded(points)
+        if len(self._pending) >= FLUSH_EVERY:
+            self.flush()
+        return [p.id for p in points]
 
+    def _note_recorded(self, points: list[PointStruct]) -> None:
+        """Keep the local history mirror current and drop stale recalls."""
+        if self._history_cache is not None:
+            self._history_cache.extend(p.payload for p in points)
+        self._recall_cache.clear()
+
+    def flush(self) -> int:
+        """Write all buffered points to Qdrant in a single upsert.
+
+        Called automatically once ``FLUSH_EVERY`` points accumulate and
+        before any read so queries always see the latest features.
+
+        Returns:
+            The number of points written.
+        """
+        if not self._pending:
+            return 0
+        points, self._pending = self._pending, []
         self.qdrant.upsert(
             collection_name=self.collection,
-            points=[
-                PointStruct(id=point_id, vector=vector, payload=payload)
-            ],
+            points=points,
         )
-        return point_id
+        return len(points)
+
+    async def arecord_feature(
+        self,
+        feature_type: str,
+        label: str,
+        user_intent: str,
+        parameters: dict,
+        extra: dict | None = None,
+    ) -> str:
+        """Async version of :meth:`record_feature`."""
+        ids = await self.arecord_features([{
+            "feature_type": feature_type,
+            "label": label,
+            "user_intent": user_intent,
+            "parameters": parameters,
+            "extra": extra,
+        }])
+        return ids[0]
+
+    async def arecord_features(self, events: list[dict]) -> list[str]:
+        """Async version of :meth:`record_features`.
+
+        Embedding goes through the async HTTP client; when the buffer
+        fills, the (blocking) Qdrant flush is pushed to a worker thread
+        so the event loop stays free for other IO.
+        """
+        descriptions = [_describe(ev) for ev in events]
+        vectors = await self.aembed(descriptions)
+        points = _build_points(events, descriptions, vectors)
+        self._pending.extend(points)
+        self._note_recorded(points)
+        if len(self._pending) >= FLUSH_EVERY:
+            await asyncio.to_thread(self.flush)
+        return [p.id for p in points]
 
     # ------------------------------------------------------------------
     # Query / recall
     # ------------------------------------------------------------------
-    def recall(self, query: str, top_k: int = 5) -> list[dict]:
+    def recall(
+        self,
+        query: str,
+        top_k: int = 5,
+        feature_type: str | None = None,
+    ) -> list[dict]:
         """Retrieve the most relevant past feature events for a query.
 
         Args:
             query: natural-language description of what the user wants
             top_k: max number of results
+            feature_type: restrict hits to one feature type (e.g.
+                "extrude"); served by the payload index, not a scan
 
         Returns:
             List of payload dicts ordered by relevance.
         """
-        vector = self._embed(query)
+        cache_key = (query, top_k, feature_type)
+        cached = self._recall_cache.get(cache_key)
+        if cached and time.monotonic() - cached[0] < RECALL_TTL_S:
+            return cached[1]
+
+        query_filter = None
+        if feature_type:
+            query_filter = Filter(must=[
+                FieldCondition(
+                    key="feature_type", match=MatchValue(value=feature_type)
+                )
+            ])
+
+        vector = self._embed_one(query)
+        self.flush()
         results = self.qdrant.query_points(
             collection_name=self.collection,
             query=vector,
+            query_filter=query_filter,
             limit=top_k,
+            search_params=_SEARCH_PARAMS,
         )
-        return [hit.payload for hit in results.points]
+        payloads = [hit.payload for hit in results.points]
+        self._recall_cache[cache_key] = (time.monotonic(), payloads)
+        return payloads
+
+    def recall_many(
+        self, queries: list[str], top_k: int = 5
+    ) -> list[list[dict]]:
+        """Run several similarity queries in one server roundtrip.
 
-    def get_full_history(self) -> list[dict]:
-        """Return every feature event stored for this part, ordered by time."""
-        # Scroll through all points
-        records, _next = self.qdrant.scroll(
+        Embeds all queries in one Ollama batch, then uses Qdrant's
+        ``query_batch_points`` so N searches cost a single request.
+
+        Returns:
+            One list of payload dicts per query, in query order.
+        """
+        vectors = self._embed(queries)
+        self.flush()
+        results = self.qdrant.query_batch_points(
             collection_name=self.collection,
-            limit=1000,
-            with_payload=True,
-            with_vectors=False,
+            requests=[
+                QueryRequest(
+                    query=vec,
+                    limit=top_k,
+                    with_payload=True,
+                    params=_SEARCH_PARAMS,
+                )
+                for vec in vectors
+            ],
         )
-        items = [r.payload for r in records]
-        items.sort(key=lambda p: p.get("timestamp", ""))
-        return items
+        return [[hit.payload for hit in res.points] for res in results]
+
+    def get_full_history(self, limit: int | None = None) -> list[dict]:
+        """Return feature events stored for this part, ordered by time.
+
+        Pages through the collection by point id in 256-point pages.
+        Qdrant does not return ``next_page_offset`` when ``order_by`` is
+        set (and rejects an explicit offset alongside it), so the
+        chronological sort happens client-side on the ``ts_ns`` key.
+
+        Args:
+            limit: stop after this many events (None = all of them).
+        """
+        if self._history_cache is not None:
+            items = self._history_cache
+            return list(items[:limit] if limit is not None else items)
+
+        self.flush()
+        items: list[dict] = []
+        offset = None
+        while True:
+            records, offset = self.qdrant.scroll(
+                collection_name=self.collection,
+                limit=256,
+                offset=offset,
+                with_payload=True,
+                with_vectors=False,
+            )
+            items.extend(r.payload for r in records)
+            if offset is None:
+                break
+        # Legacy points recorded before ts_ns existed fall back to their
+        # ISO timestamp and sort ahead of integer-keyed ones.
+        items.sort(key=lambda p: (p.get("ts_ns", 0), p.get("timestamp", "")))
+        # Complete fetch: keep it as the mirror; record_features appends
+        # to it from here on.  Return a copy so callers can't mutate it.
+        self._history_cache = items
+        return list(items[:limit] if limit is not None else items)
 
     def build_context_summary(self, query: str = "") -> str:
         """Build a text summary of this part's history for injection into
         a Claude prompt.  If *query* is given, the most relevant events
-        are listed first; otherwise the full chronological history is used.
+        are listed first; otherwise the most recent events are used.
+
+        Output is bounded (last ``SUMMARY_MAX_EVENTS`` events, each line
+        shortened to ``SUMMARY_LINE_WIDTH`` chars) so prompt cost stays
+        flat as the session grows.
         """
         if query:
-            events = self.recall(query, top_k=10)
+            events = self.recall(query, top_k=5)
         else:
-            events = self.get_full_history()
+            events = self.get_full_history()[-SUMMARY_MAX_EVENTS:]
 
         if not events:
             return "No prior features recorded for this part."
 
         lines = [f"## Feature history for part '{self.part_name}'\n"]
         for i, ev in enumerate(events, 1):
-            lines.append(
+            line = (
                 f"{i}. [{ev.get('feature_type')}] \"{ev.get('label')}\" – "
                 f"{ev.get('user_intent')} (params: {ev.get('parameters')}, "
                 f"time: {ev.get('timestamp')})"
             )
+            lines.append(textwrap.shorten(line, width=SUMMARY_LINE_WIDTH))
         return "\n".join(lines)
 
 
+def warmup_embeddings(ollama_url: str = DEFAULT_OLLAMA_URL) -> None:
+    """Force Ollama to load the embedding model ahead of real traffic.
+
+    nomic-embed-text is lazy-loaded on the first ``/api/embed`` call, so
+    without this the first recorded feature pays a multi-second cold
+    start.  Failures are ignored; if Ollama isn't up yet the first real
+    call will surface the error instead.
+    """
+    try:
+        _HTTP.post(
+            f"{ollama_url.rstrip('/')}/api/embed",
+            json={"model": EMBEDDING_MODEL, "input": ["warmup"]},
+        )
+    except httpx.HTTPError:
+        pass
+
+
+class PartMemoryPool:
+    """Vends PartMemory handles that share one Qdrant connection.
+
+    The main loop may create a memory per part; constructing each one
+    with its own QdrantClient repeats the connection handshake every
+    time.  The pool owns a single gRPC client (the HTTP client and the
+    collection cache are already process-wide) and hands out cached
+    PartMemory instances bound to it.
+    """
+
+    def __init__(
+        self,
+        qdrant_url: str = DEFAULT_QDRANT_URL,
+        ollama_url: str = DEFAULT_OLLAMA_URL,
+    ):
+        self.qdrant_url = qdrant_url
+        self.ollama_url = ollama_url
+        self.qdrant = QdrantClient(
+            url=qdrant_url,
+            prefer_grpc=True,
+            grpc_port=DEFAULT_QDRANT_GRPC_PORT,
+            pool_size=QDRANT_POOL_SIZE,
+            timeout=60,
+        )
+        self._memories: dict[str, PartMemory] = {}
+
+    def get(self, part_name: str) -> PartMemory:
+        """Return the memory for *part_name*, creating it on first use."""
+        memory = self._memories.get(part_name)
+        if memory is None:
+            memory = PartMemory(
+                part_name,
+                ollama_url=self.ollama_url,
+                qdrant_client=self.qdrant,
+            )
+            self._memories[part_name] = memory
+        return memory
+
+    def flush_all(self) -> None:
+        """Flush pending points for every part vended by this pool."""
+        for memory in self._memories.values():
+            memory.flush()
+
+
 # ---------------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------------
+def _describe(event: dict) -> str:
+    """Build the embeddable description text for a feature event.
+
+    Parameters are rendered as compact JSON rather than dict repr: the
+    string is 20-40% shorter, which means fewer tokens for the embedding
+    model and smaller cache keys.
+    """
+    params_str = json.dumps(
+        event["parameters"], separators=(",", ":"), default=str
+    )
+    return (
+        f"{event['feature_type']}:{event['label']}"
+        f"|intent:{event['user_intent']}"
+        f"|params:{params_str}"
+    )
+
+
+def _build_points(
+    events: list[dict],
+    descriptions: list[str],
+    vectors: list[list[float]],
+) -> list[PointStruct]:
+    """Turn feature events plus their vectors into Qdrant points."""
+    points = []
+    for ev, description, vector in zip(events, descriptions, vectors):
+        payload = {
+            "feature_type": ev["feature_type"],
+            "label": ev["label"],
+            "user_intent": ev["user_intent"],
+            "parameters": ev["parameters"],
+            # Monotonic-enough integer key for ordering; the ISO string
+            # is kept purely for display.
+            "ts_ns": time.time_ns(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "description": description,
+        }
+        if ev.get("extra"):
+            payload.update(ev["extra"])
+        points.append(
+            PointStruct(id=str(uuid.uuid4()), vector=vector, payload=payload)
+        )
+    return points
+
+
+class _SanitiseTable(dict):
+    """Translation table replacing disallowed characters with '_'."""
+
+    def __missing__(self, codepoint):
+        # Anything outside the precomputed ASCII range (e.g. unicode
+        # part names) maps to '_' as well.
+        return "_"
+
+
+# Precomputed once so sanitising runs entirely in C via str.translate.
+_SANITISE = _SanitiseTable({
+    cp: chr(cp) if chr(cp) in set(string.ascii_letters + string.digits + "_-")
+    else "_"
+    for cp in range(128)
+})
+
+
 def _safe_collection_name(name: str) -> str:
     """Convert an arbitrary part name into a valid Qdrant collection name."""
-    safe = "".join(c if c.isalnum() or c in ("_", "-") else "_" for c in name)
-    return f"sw_part_{safe}"[:128]
+    return f"sw_part_{name.translate(_SANITISE)}"[:128]
@@ -1,13 +1,21 @@
+import asyncio
 import configparser
-import tempfile
 import os
 
 import anthropic
+import ctranslate2
+import numpy as np
 from faster_whisper import WhisperModel
 import speech_recognition as sr
 
 from pySldWrap import sw_tools
-from part_memory import PartMemory
+from concurrent.futures import ThreadPoolExecutor
+
+from part_memory import (
+    PartMemoryPool,
+    aclose_async_client,
+    warmup_embeddings,
+)
 
 # ---------------------------------------------------------------------------
 # Configuration
@@ -29,12 +37,42 @@ if anthropic_base_url:
     client_kwargs["base_url"] = anthropic_base_url
     print(f"Using custom Anthropic base URL: {anthropic_base_url}")
 claude_client = anthropic.Anthropic(**client_kwargs)
-
-# Local Whisper model for speech-to-text (runs entirely on device)
+async_claude = anthropic.AsyncAnthropic(**client_kwargs)
+
+# Local Whisper model for speech-to-text (runs entirely on device).
+# Pick the quantized CTranslate2 kernels explicitly: "auto" tends to
+# resolve to fp16/fp32, while int8 halves encoder memory bandwidth with
+# no meaningful WER cost on short voice commands.
+if ctranslate2.get_cuda_device_count() > 0:
+    whisper_kwargs = {"device": "cuda", "compute_type": "int8_float16"}
+else:
+    whisper_kwargs = {
+        "device": "cpu",
+        "compute_type": "int8",
+        "cpu_threads": max(1, (os.cpu_count() or 2) // 2),
+        "num_workers": 2,
+    }
 print(f"Loading local Whisper model ({whisper_model_size})...")
-whisper_model = WhisperModel(whisper_model_size, device="auto", compute_type="auto")
+whisper_model = WhisperModel(whisper_model_size, **whisper_kwargs)
 print("Whisper model loaded.")
 
+
+def _warm_whisper():
+    # CTranslate2 lazy-initialises its kernels on the first transcribe;
+    # 0.2s of silence forces that now instead of on the first command.
+    segments, _info = whisper_model.transcribe(
+        np.zeros(3200, np.float32), beam_size=1
+    )
+    list(segments)
+
+
+# Warm both local models in parallel so the first voice command doesn't
+# pay their cold-start cost.
+with ThreadPoolExecutor(max_workers=2) as _warm:
+    _warm.submit(_warm_whisper)
+    _warm.submit(warmup_embeddings, ollama_url)
+print("Models warmed up.")
+
 # ---------------------------------------------------------------------------
 # SolidWorks connection
 # ---------------------------------------------------------------------------
@@ -60,6 +98,19 @@ def get_claude_response(prompt, system=None):
     return message.content[0].text.strip()
 
 
+async def aget_claude_response(prompt, system=None):
+    """Async version of get_claude_response (non-blocking network IO)."""
+    kwargs = {
+        "model": CLAUDE_MODEL,
+        "max_tokens": 1024,
+        "messages": [{"role": "user", "content": prompt}],
+    }
+    if system:
+        kwargs["system"] = system
+    message = await async_claude.messages.create(**kwargs)
+    return message.content[0].text.strip()
+
+
 # ---------------------------------------------------------------------------
 # Speech-to-text using local Whisper (faster-whisper)
 # ---------------------------------------------------------------------------
@@ -71,14 +122,22 @@ def recognize_speech():
         recognizer.adjust_for_ambient_noise(source, duration=0.5)
         audio = recognizer.listen(source)
 
-    # Write captured audio to a temporary WAV file for local Whisper
-    wav_data = audio.get_wav_data()
-    tmp = tempfile.NamedTemporaryFile(suffix=".wav", delete=False)
     try:
-        tmp.write(wav_data)
-        tmp.close()
-
-        segments, _info = whisper_model.transcribe(tmp.name, beam_size=5)
+        # Feed the captured PCM straight to faster-whisper as a float32
+        # array - no temp WAV file, no disk roundtrip. 16 kHz mono is
+        # what the Whisper encoder expects.
+        raw = audio.get_raw_data(convert_rate=16000, convert_width=2)
+        audio_np = np.frombuffer(raw, np.int16).astype(np.float32) / 32768.0
+
+        # Greedy decoding (beam_size=1) is accurate enough for short
+        # voice commands and ~5x cheaper than beam search; VAD trims the
+        # silent tail so the decoder sees fewer frames.
+        segments, _info = whisper_model.transcribe(
+            audio_np,
+            beam_size=1,
+            vad_filter=True,
+            condition_on_previous_text=False,
+        )
         text = " ".join(segment.text for segment in segments).strip()
 
         if text:
@@ -90,14 +149,12 @@ def recognize_speech():
     except Exception as e:
         print(f"Speech recognition error: {e}")
         return None
-    finally:
-        os.unlink(tmp.name)
 
 
 # ---------------------------------------------------------------------------
 # Feature labeling – ask Claude to generate a descriptive label
 # ---------------------------------------------------------------------------
-def generate_feature_label(feature_type, user_intent, params, context_summary=""):
+async def generate_feature_label(feature_type, user_intent, params, context_summary=""):
     """Ask Claude to produce a short, descriptive label for a SolidWorks feature."""
     prompt = (
         "You are a SolidWorks feature naming assistant.\n"
@@ -105,15 +162,22 @@ def generate_feature_label(feature_type, user_intent, params, context_summary=""
         f"User's voice command: \"{user_intent}\"\n"
         f"Parameters: {params}\n"
     )
-    if context_summary:
-        prompt += f"\nExisting part history:\n{context_summary}\n"
     prompt += (
         "\nGenerate a short (2-5 word) descriptive label for this feature that "
         "would make sense in a SolidWorks feature tree. "
         "Respond with ONLY the label, nothing else.\n"
         "Examples: 'Base Plate Sketch', 'Main Body Extrude', 'Edge Fillet 5mm'"
     )
-    return get_claude_response(prompt)
+    # The part history only changes when a feature is recorded, so serve
+    # it as a cacheable system block instead of re-tokenizing each call.
+    system = None
+    if context_summary:
+        system = [{
+            "type": "text",
+            "text": f"Existing part history:\n{context_summary}",
+            "cache_control": {"type": "ephemeral"},
+        }]
+    return await aget_claude_response(prompt, system=system)
 
 
 def rename_sw_feature(model, old_name, new_label):
@@ -139,7 +203,7 @@ def rename_sw_feature(model, old_name, new_label):
 # ---------------------------------------------------------------------------
 # Sketch creation
 # ---------------------------------------------------------------------------
-def parse_sketch_command(user_command):
+async def parse_sketch_command(user_command):
     """Use Claude to interpret a voice command and return structured sketch info."""
     prompt = (
         "You are a SolidWorks automation assistant. "
@@ -154,12 +218,12 @@ def parse_sketch_command(user_command):
         "For a line: x1,y1,x2,y2  "
         "If the user did not specify dimensions, use sensible defaults."
     )
-    return get_claude_response(prompt)
+    return await aget_claude_response(prompt)
 
 
-def create_sketch(sketch_type, *args):
+async def create_sketch(sketch_type, *args):
     """Create a sketch in SolidWorks via pySldWrap."""
-    instruction = get_claude_response(
+    instruction = await aget_claude_response(
         f"Give a brief explanation of how to create a {sketch_type} sketch "
         "in SOLIDWORKS using the Python COM API (pywin32). Keep it under 3 sentences."
     )
@@ -188,7 +252,7 @@ def create_sketch(sketch_type, *args):
     return model
 
 
-def add_dimensions(model, dimensions_text):
+async def add_dimensions(model, dimensions_text):
     """Use Claude to interpret dimension instructions and apply them."""
     prompt = (
         "You are a SolidWorks automation assistant. The user wants to add "
@@ -197,7 +261,7 @@ def add_dimensions(model, dimensions_text):
         "Extract the numeric dimension values (in metres) and which sketch "
         "entities they apply to. Respond with a short summary of the changes."
     )
-    response = get_claude_response(prompt)
+    response = await aget_claude_response(prompt)
     print("Dimension guidance:", response)
 
 
@@ -315,13 +379,29 @@ SYSTEM_PROMPT = (
 )
 
 
-def route_command(user_command, context_summary=""):
+async def route_command(user_command, context_summary=""):
     """Use Claude to classify a voice command into an action + params."""
-    system = SYSTEM_PROMPT
+    # Mark the static router prompt and the part history as cacheable.
+    # Callers must pass the stable no-query summary here: it only
+    # changes when a feature is recorded, so the prefix repeats across
+    # commands. Note the router prompt alone (~400 tokens) is below
+    # Anthropic's 1024-token caching minimum; caching kicks in once the
+    # history block pushes the prefix past it.
+    system = [
+        {
+            "type": "text",
+            "text": SYSTEM_PROMPT,
+            "cache_control": {"type": "ephemeral"},
+        }
+    ]
     if context_summary:
-        system += f"\n\nPart history for context:\n{context_summary}\n"
+        system.append({
+            "type": "text",
+            "text": f"Part history for context:\n{context_summary}",
+            "cache_control": {"type": "ephemeral"},
+        })
 
-    message = claude_client.messages.create(
+    message = await async_claude.messages.create(
         model=CLAUDE_MODEL,
         max_tokens=256,
         system=system,
@@ -337,7 +417,7 @@ def route_command(user_command, context_summary=""):
 # ---------------------------------------------------------------------------
 # Main loop
 # ---------------------------------------------------------------------------
-if __name__ == "__main__":
+async def main_async():
     print("SolidWorks Sketch Automation (Claude + Local Whisper STT)")
     print(f"Connected to SolidWorks {sw_version}")
     print(
@@ -346,193 +426,232 @@ if __name__ == "__main__":
     )
 
     active_model = None
-    memory = None  # PartMemory instance, created when first sketch is made
+    # One pool per session: a single Qdrant connection serves every part.
+    memory_pool = PartMemoryPool(qdrant_url=qdrant_url, ollama_url=ollama_url)
+    memory = None  # PartMemory handle, created when first sketch is made
     part_name = "Untitled"
     feature_counter = 0
 
-    while True:
-        user_command = recognize_speech()
-        if not user_command:
-            continue
-
-        # Build context from memory if available
-        context_summary = ""
-        if memory:
-            context_summary = memory.build_context_summary(user_command)
-
-        action, params_str = route_command(user_command, context_summary)
-        print(f"Action: {action}  Params: {params_str}")
-
-        # Parse numeric params where applicable
-        params = []
-        if params_str:
-            try:
-                params = [float(v.strip()) for v in params_str.split(",")]
-            except ValueError:
-                params = [params_str]
-
-        if action == "sketch":
-            sketch_sub = parse_sketch_command(user_command)
-            sub_lines = sketch_sub.strip().splitlines()
-            sketch_type = sub_lines[0].strip().lower()
-            sketch_params = []
-            if len(sub_lines) > 1:
+    try:
+        while True:
+            user_command = await asyncio.to_thread(recognize_speech)
+            if not user_command:
+                continue
+
+            # Build context from memory if available. The no-query summary
+            # (recent events, chronological) only changes when a feature is
+            # recorded, so the cache_control'd prompt block it feeds stays
+            # byte-identical between commands and actually hits the prompt
+            # cache - a per-utterance recall summary never would.
+            context_summary = ""
+            if memory:
+                context_summary = await asyncio.to_thread(
+                    memory.build_context_summary
+                )
+
+            action, params_str = await route_command(user_command, context_summary)
+            print(f"Action: {action}  Params: {params_str}")
+
+            # Parse numeric params where applicable
+            params = []
+            if params_str:
                 try:
-                    sketch_params = [
-                        float(v.strip()) for v in sub_lines[1].split(",")
-                    ]
+                    params = [float(v.strip()) for v in params_str.split(",")]
                 except ValueError:
-                    sketch_params = []
-
-            print(f"Creating a {sketch_type} sketch...")
-            active_model = create_sketch(sketch_type, *sketch_params)
-            feature_counter += 1
-
-            # Initialise memory for this part
-            part_name = f"Part_{feature_counter}"
-            memory = PartMemory(
-                part_name, qdrant_url=qdrant_url, ollama_url=ollama_url
-            )
-
-            # Generate and apply descriptive label
-            label = generate_feature_label(
-                f"sketch_{sketch_type}", user_command,
-                sketch_params, context_summary,
-            )
-            rename_sw_feature(active_model, f"Sketch1", label)
-
-            # Record in memory
-            memory.record_feature(
-                feature_type=f"sketch_{sketch_type}",
-                label=label,
-                user_intent=user_command,
-                parameters={"type": sketch_type, "coords": sketch_params},
-            )
-            print(f"[Memory] Recorded: {label}")
-
-        elif action == "extrude":
-            if active_model and memory:
-                depth = params[0] if params else 0.01
-                extrude_sketch(active_model, depth)
-                label = generate_feature_label(
-                    "extrude", user_command, {"depth": depth}, context_summary
+                    params = [params_str]
+
+            if action == "sketch":
+                sketch_sub = await parse_sketch_command(user_command)
+                sub_lines = sketch_sub.strip().splitlines()
+                sketch_type = sub_lines[0].strip().lower()
+                sketch_params = []
+                if len(sub_lines) > 1:
+                    try:
+                        sketch_params = [
+                            float(v.strip()) for v in sub_lines[1].split(",")
+                        ]
+                    except ValueError:
+                        sketch_params = []
+
+                print(f"Creating a {sketch_type} sketch...")
+                active_model = await create_sketch(sketch_type, *sketch_params)
+                feature_counter += 1
+
+                # Initialise memory for this part
+                part_name = f"Part_{feature_counter}"
+                memory = memory_pool.get(part_name)
+
+                # Generate and apply descriptive label
+                label = await generate_feature_label(
+                    f"sketch_{sketch_type}", user_command,
+                    sketch_params, context_summary,
                 )
-                rename_sw_feature(active_model, "Boss-Extrude1", label)
-                memory.record_feature(
-                    feature_type="extrude", label=label,
+                # Start the embed+store roundtrip, then rename in SolidWorks
+                # while it is in flight. The rename is COM and must stay on
+                # this (STA) thread.
+                record_task = asyncio.create_task(memory.arecord_feature(
+                    feature_type=f"sketch_{sketch_type}",
+                    label=label,
                     user_intent=user_command,
-                    parameters={"depth": depth},
-                )
-                print(f"[Memory] Recorded: {label}")
-            else:
-                print("No active model. Create a sketch first.")
-
-        elif action == "fillet":
-            if active_model and memory:
-                radius = params[0] if params else 0.005
-                add_fillet(active_model, radius)
-                label = generate_feature_label(
-                    "fillet", user_command, {"radius": radius}, context_summary
-                )
-                memory.record_feature(
-                    feature_type="fillet", label=label,
-                    user_intent=user_command,
-                    parameters={"radius": radius},
-                )
+                    parameters={"type": sketch_type, "coords": sketch_params},
+                ))
+                await asyncio.sleep(0)  # let the embed request start
+                rename_sw_feature(active_model, "Sketch1", label)
+                await record_task
                 print(f"[Memory] Recorded: {label}")
-            else:
-                print("No active model. Create a sketch first.")
-
-        elif action == "chamfer":
-            if active_model and memory:
-                dist = params[0] if params else 0.002
-                add_chamfer(active_model, dist)
-                label = generate_feature_label(
-                    "chamfer", user_command, {"distance": dist}, context_summary
-                )
-                memory.record_feature(
-                    feature_type="chamfer", label=label,
-                    user_intent=user_command,
-                    parameters={"distance": dist},
-                )
-                print(f"[Memory] Recorded: {label}")
-            else:
-                print("No active model. Create a sketch first.")
-
-        elif action == "mirror":
-            if active_model and memory:
-                plane = params_str if params_str else "Front Plane"
-                mirror_feature(active_model, plane)
-                label = generate_feature_label(
-                    "mirror", user_command, {"plane": plane}, context_summary
-                )
-                memory.record_feature(
-                    feature_type="mirror", label=label,
-                    user_intent=user_command,
-                    parameters={"plane": plane},
-                )
-                print(f"[Memory] Recorded: {label}")
-            else:
-                print("No active model. Create a sketch first.")
-
-        elif action == "pattern":
-            if active_model and memory:
-                count = int(params[0]) if len(params) >= 1 else 3
-                spacing = params[1] if len(params) >= 2 else 0.02
-                linear_pattern(active_model, count, spacing)
-                label = generate_feature_label(
-                    "linear_pattern", user_command,
-                    {"count": count, "spacing": spacing}, context_summary,
-                )
-                memory.record_feature(
-                    feature_type="linear_pattern", label=label,
-                    user_intent=user_command,
-                    parameters={"count": count, "spacing": spacing},
-                )
-                print(f"[Memory] Recorded: {label}")
-            else:
-                print("No active model. Create a sketch first.")
-
-        elif action == "dimension":
-            if active_model and memory:
-                print("Say the dimensions you want to add or modify.")
-                dim_cmd = recognize_speech()
-                if dim_cmd:
-                    add_dimensions(active_model, dim_cmd)
-                    memory.record_feature(
-                        feature_type="dimension_edit",
-                        label="Dimension Modification",
-                        user_intent=dim_cmd,
-                        parameters={"raw_command": dim_cmd},
-                    )
-            else:
-                print("No active model. Create a sketch first.")
 
-        elif action == "recall":
-            if memory:
-                history = memory.build_context_summary()
-                print("\n" + history + "\n")
-            else:
-                print("No part memory yet. Create a sketch first.")
-
-        elif action == "export":
-            if active_model:
-                path = params_str if params_str else "model.STEP"
-                export_model(active_model, path)
-                if memory:
-                    memory.record_feature(
-                        feature_type="export", label=f"Export to {path}",
+            elif action == "extrude":
+                if active_model and memory:
+                    depth = params[0] if params else 0.01
+                    # Label generation (network) overlaps the COM extrude.
+                    # COM objects live in this thread's apartment, so the
+                    # call itself must stay here; yielding once lets the
+                    # label request go on the wire first.
+                    label_task = asyncio.create_task(generate_feature_label(
+                        "extrude", user_command, {"depth": depth}, context_summary
+                    ))
+                    await asyncio.sleep(0)
+                    extrude_sketch(active_model, depth)
+                    label = await label_task
+                    record_task = asyncio.create_task(memory.arecord_feature(
+                        feature_type="extrude", label=label,
+                        user_intent=user_command,
+                        parameters={"depth": depth},
+                    ))
+                    await asyncio.sleep(0)  # let the embed request start
+                    rename_sw_feature(active_model, "Boss-Extrude1", label)
+                    await record_task
+                    print(f"[Memory] Recorded: {label}")
+                else:
+                    print("No active model. Create a sketch first.")
+
+            elif action == "fillet":
+                if active_model and memory:
+                    radius = params[0] if params else 0.005
+                    label_task = asyncio.create_task(generate_feature_label(
+                        "fillet", user_command, {"radius": radius}, context_summary
+                    ))
+                    await asyncio.sleep(0)  # let the label request start
+                    add_fillet(active_model, radius)
+                    label = await label_task
+                    await memory.arecord_feature(
+                        feature_type="fillet", label=label,
+                        user_intent=user_command,
+                        parameters={"radius": radius},
+                    )
+                    print(f"[Memory] Recorded: {label}")
+                else:
+                    print("No active model. Create a sketch first.")
+
+            elif action == "chamfer":
+                if active_model and memory:
+                    dist = params[0] if params else 0.002
+                    label_task = asyncio.create_task(generate_feature_label(
+                        "chamfer", user_command, {"distance": dist}, context_summary
+                    ))
+                    await asyncio.sleep(0)  # let the label request start
+                    add_chamfer(active_model, dist)
+                    label = await label_task
+                    await memory.arecord_feature(
+                        feature_type="chamfer", label=label,
+                        user_intent=user_command,
+                        parameters={"distance": dist},
+                    )
+                    print(f"[Memory] Recorded: {label}")
+                else:
+                    print("No active model. Create a sketch first.")
+
+            elif action == "mirror":
+                if active_model and memory:
+                    plane = params_str if params_str else "Front Plane"
+                    label_task = asyncio.create_task(generate_feature_label(
+                        "mirror", user_command, {"plane": plane}, context_summary
+                    ))
+                    await asyncio.sleep(0)  # let the label request start
+                    mirror_feature(active_model, plane)
+                    label = await label_task
+                    await memory.arecord_feature(
+                        feature_type="mirror", label=label,
                         user_intent=user_command,
-                        parameters={"path": path},
+                        parameters={"plane": plane},
                     )
+                    print(f"[Memory] Recorded: {label}")
+                else:
+                    print("No active model. Create a sketch first.")
+
+            elif action == "pattern":
+                if active_model and memory:
+                    count = int(params[0]) if len(params) >= 1 else 3
+                    spacing = params[1] if len(params) >= 2 else 0.02
+                    label_task = asyncio.create_task(generate_feature_label(
+                        "linear_pattern", user_command,
+                        {"count": count, "spacing": spacing}, context_summary,
+                    ))
+                    await asyncio.sleep(0)  # let the label request start
+                    linear_pattern(active_model, count, spacing)
+                    label = await label_task
+                    await memory.arecord_feature(
+                        feature_type="linear_pattern", label=label,
+                        user_intent=user_command,
+                        parameters={"count": count, "spacing": spacing},
+                    )
+                    print(f"[Memory] Recorded: {label}")
+                else:
+                    print("No active model. Create a sketch first.")
+
+            elif action == "dimension":
+                if active_model and memory:
+                    print("Say the dimensions you want to add or modify.")
+                    dim_cmd = await asyncio.to_thread(recognize_speech)
+                    if dim_cmd:
+                        await add_dimensions(active_model, dim_cmd)
+                        await memory.arecord_feature(
+                            feature_type="dimension_edit",
+                            label="Dimension Modification",
+                            user_intent=dim_cmd,
+                            parameters={"raw_command": dim_cmd},
+                        )
+                else:
+                    print("No active model. Create a sketch first.")
+
+            elif action == "recall":
+                if memory:
+                    history = await asyncio.to_thread(
+                        memory.build_context_summary
+                    )
+                    print("\n" + history + "\n")
+                else:
+                    print("No part memory yet. Create a sketch first.")
+
+            elif action == "export":
+                if active_model:
+                    path = params_str if params_str else "model.STEP"
+                    export_model(active_model, path)
+                    if memory:
+                        await memory.arecord_feature(
+                            feature_type="export", label=f"Export to {path}",
+                            user_intent=user_command,
+                            parameters={"path": path},
+                        )
+                else:
+                    print("No active model to export.")
+
+            elif action == "quit":
+                memory_pool.flush_all()
+                print("Exiting.")
+                break
+
             else:
-                print("No active model to export.")
+                print(f"Unknown action '{action}'. Try again.")
 
-        elif action == "quit":
-            print("Exiting.")
-            break
+            print("Ready for next command.\n")
+    finally:
+        # Persist anything still buffered no matter how the session
+        # ends - Ctrl-C, a crash, or Whisper mishearing "quit".
+        memory_pool.flush_all()
+        # Close the async HTTP client while its event loop still runs.
+        await aclose_async_client()
 
-        else:
-            print(f"Unknown action '{action}'. Try again.")
 
-        print("Ready for next command.\n")
+if __name__ == "__main__":
+    asyncio.run(main_async())